@@ -1,402 +1,660 @@
-import streamlit as st
-import pandas as pd
-import os
-import base64
-from datetime import datetime
-from geocoding_functions import get_coordinates_for_locations, display_summary
-from nominatim_geocoding import get_coordinates_with_nominatim
-
-# Set page config
-st.set_page_config(
-    page_title="Get Station Coordinates",
-    page_icon="🌎",
-    layout="wide"
-)
-
-# Custom CSS to improve the appearance
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: 700;
-        color: #1E88E5;
-        margin-bottom: 1rem;
-        text-align: center;
-    }
-    .section-header {
-        font-size: 1.5rem;
-        font-weight: 600;
-        color: #0D47A1;
-        margin-top: 1.5rem;
-        margin-bottom: 1rem;
-    }
-    .info-text {
-        font-size: 1rem;
-        color: #424242;
-        margin-bottom: 1rem;
-    }
-    .success-box {
-        background-color: #E8F5E9;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border-left: 0.5rem solid #43A047;
-        margin: 1rem 0;
-    }
-    .warning-box {
-        background-color: #FFF8E1;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border-left: 0.5rem solid #FFA000;
-        margin: 1rem 0;
-    }
-    .error-box {
-        background-color: #FFEBEE;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border-left: 0.5rem solid #E53935;
-        margin: 1rem 0;
-    }
-    .detail-box {
-        background-color: #E3F2FD;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 0.5rem 0;
-    }
-    .provider-box {
-        display: flex;
-        align-items: center;
-        gap: 1rem;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-        box-shadow: 0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24);
-    }
-    .provider-box.selected {
-        border: 2px solid #1E88E5;
-        background-color: #E3F2FD;
-    }
-    .provider-logo {
-        width: 50px;
-        height: 50px;
-        object-fit: contain;
-    }
-    .emoji {
-        font-size: 1.2rem;
-        margin-right: 0.5rem;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# App title and description
-st.markdown('<div class="main-header">🌍 Get Station Coordinates Tool</div>', unsafe_allow_html=True)
-
-st.markdown("<br><br>", unsafe_allow_html=True)  # Add even more vertical space
-
-# Add attention message
-st.markdown("""
-<div class="warning-box">
-    <strong>⚠️ Attention:</strong> This tool is not 100% reliable. It is intended to help map stations for integrations that use the "points" system (such as Redbus), or integrations that do not show coordinates and addresses to customers.<br>
-    For detailed information on how the tool works, please refer to the <a href="https://one2go.atlassian.net/wiki/x/GwCE-g" target="_blank">Confluence documentation</a>.
-</div>
-""", unsafe_allow_html=True)
-
-# Create a download link for the results
-def get_download_link(df, filename, text):
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">📥 {text}</a>'
-    return href
-
-# Sidebar for inputs
-with st.sidebar:
-    st.markdown('<div class="section-header">⚙️ Configuration</div>', unsafe_allow_html=True)
-    
-    # Geocoding provider selection
-    st.markdown("### Choose a Geocoding Provider")
-    
-    # Use a single radio button for provider selection
-    provider = st.radio(
-        "Select a provider:",
-        ["Google Maps API", "Nominatim (Free)"],
-        index=0 if "provider" not in st.session_state or st.session_state.provider == "google" else 1,
-        key="provider_radio"
-    )
-    
-    # Update session state based on selection
-    if provider == "Google Maps API":
-        st.session_state.provider = "google"
-    else:
-        st.session_state.provider = "nominatim"
-    
-    # Provider description
-    if st.session_state.provider == "google":
-        st.markdown("""
-        <div class="info-text">
-            <strong>Google Maps API</strong><br>
-            ✓ High accuracy<br>
-            ✓ Consistent results<br>
-            ❌ Requires an API key<br>
-            ❌ Only 3000 free requests per month
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # API Key input (only for Google Maps)
-        api_key = st.text_input("Google Maps API Key", help="Enter your Google Maps API key")
-        
-        # Nouvelle option : search without locality filter
-        search_without_locality_filter = st.checkbox(
-            "Search without locality filter",
-            value=False,
-            help="If enabled, the search will be performed without restricting to the locality. This may maximize results but can lead to less relevant matches. If disabled, the search will use the locality filter for more precise results."
-        )
-    else:
-        st.markdown("""
-        <div class="info-text">
-            <strong>Nominatim / OpenStreetMap</strong><br>
-            ✓ Completely free<br>
-            ✓ No API key required<br>
-            ❌ Accuracy is really not as good<br>
-            ❌ Slower<br>
-        </div>
-        """, unsafe_allow_html=True)
-        api_key = None  # Not needed for Nominatim
-
-        # Option à cocher pour restreindre à settlement
-        lock_to_settlement = st.checkbox(
-            "Restrict search to locality only",
-            value=False,
-            help="If enabled, only results classified as settlements (cities, towns, villages, etc.) will be returned by Nominatim. May improve relevance for locality searches."
-        )
-    
-    # Common settings
-    st.markdown("### Common Settings")
-    
-    # Country input (optional)
-    country = st.text_input("Country (optional but recommended)", 
-                            help="Specify the country to narrow down geocoding results (e.g., France, Belgium, Canada)")
-    
-    # Output file name
-    output_filename = st.text_input("Output File Name", 
-                                   value="geocoding_results.csv", 
-                                   help="Name of the output CSV file")
-    
-    # Error detection threshold
-    error_threshold = st.number_input("Error Detection Threshold", 
-                                     min_value=2, 
-                                     value=5, 
-                                     help="Number of identical coordinates/addresses with different station names to flag as a potential error")
-
-# Main content
-
-
-# File uploader
-uploaded_file = st.file_uploader("Upload a CSV file with station names", type=["csv"])
-
-if uploaded_file is not None:
-    try:
-        # Read the uploaded file
-        df = pd.read_csv(uploaded_file)
-        
-        # Show dataframe preview
-        st.markdown('<div class="section-header">👀 Data Preview</div>', unsafe_allow_html=True)
-        st.dataframe(df, use_container_width=True)
-        
-        # Column selection
-        st.markdown('<div class="section-header">🛠️ Column Selection</div>', unsafe_allow_html=True)
-        
-        available_columns = df.columns.tolist()
-        
-        # Default to 'remote_name' if available, otherwise let user select
-        default_name_column = 'remote_name' if 'remote_name' in available_columns else available_columns[0]
-        name_column = st.selectbox("Select the column for location names:", available_columns, index=available_columns.index(default_name_column) if default_name_column in available_columns else 0)
-        
-        # Default to 'remote_city_name' if available, otherwise let user select
-        city_column_options = ["None"] + available_columns
-        default_city_column = 'remote_city_name' if 'remote_city_name' in available_columns else "None"
-        city_column_index = city_column_options.index(default_city_column) if default_city_column in city_column_options else 0
-        city_column = st.selectbox("Select the column for city names (optional):", city_column_options, index=city_column_index)
-        
-        # Convert "None" to None
-        city_column = None if city_column == "None" else city_column
-        
-        # Process button
-        button_label = "📍 Get Coordinates"
-        if st.session_state.provider == "google":
-            button_label += " (Google Maps)"
-            if not api_key:
-                st.error("Please enter your Google Maps API key")
-                can_process = False
-            else:
-                can_process = True
-        else:
-            button_label += " (Nominatim)"
-            can_process = True
-            
-        if st.button(button_label) and can_process:
-            # Create progress message
-            progress_message = st.empty()
-            progress_message.info("Processing started... This may take time for large datasets.")
-
-            # Progress bar
-            progress_bar = st.progress(0, text="Geocoding in progress...")
-
-            # Define output file path (in the same directory)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            provider_name = "google" if st.session_state.provider == "google" else "nominatim"
-            output_file = f"{output_filename.split('.')[0]}_{provider_name}_{timestamp}.csv"
-
-            # Progress callback
-            def update_progress(current, total):
-                progress = current / total
-                progress_bar.progress(progress, text=f"Geocoding: {current}/{total}")
-
-            # Process the data based on selected provider
-            if st.session_state.provider == "google":
-                # search_without_locality_filter n'existe que si Google Maps est sélectionné
-                result_df = get_coordinates_for_locations(
-                    df, 
-                    output_file, 
-                    api_key, 
-                    country=country, 
-                    name_column=name_column, 
-                    city_column=city_column,
-                    progress_callback=update_progress,
-                    search_without_locality_filter=search_without_locality_filter
-                )
-            else:  # Nominatim / OSM
-                result_df = get_coordinates_with_nominatim(
-                    df,
-                    output_file,
-                    country=country,
-                    name_column=name_column,
-                    city_column=city_column,
-                    progress_callback=update_progress,
-                    lock_to_settlement=lock_to_settlement  # <-- Passe l'option ici
-                )
-
-            progress_bar.progress(1.0, text="Geocoding completed!")
-
-            # Get summary and filtered results
-            summary, filtered_df = display_summary(result_df, country=country, name_column=name_column)
-            
-            # Update progress message
-            progress_message.success("Processing completed!")
-            
-            # Show summary
-            st.markdown('<div class="section-header">📊 Results Summary</div>', unsafe_allow_html=True)
-            st.markdown(f"""
-            <div class="success-box">
-                <p>✅ <strong>Processing completed!</strong></p>
-                <p>Total locations: {summary['total_locations']}</p>
-                <p>Locations with coordinates: {summary['locations_with_coordinates']} ({summary['success_rate']:.1f}%)</p>
-                <p>Locations without coordinates: {summary['locations_without_coordinates']} ({100-summary['success_rate']:.1f}%)</p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Check for potential errors
-            potential_errors = summary['potential_errors']
-            
-            # Display potential errors if any
-            if potential_errors['duplicate_coordinates'] or potential_errors['duplicate_addresses']:
-                st.markdown('<div class="section-header">⚠️ Potential Errors Detected</div>', unsafe_allow_html=True)
-                
-                st.markdown("""
-                <div class="warning-box">
-                    <p>⚠️ <strong>Warning:</strong> The following potential errors were detected:</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Show duplicate coordinates
-                if potential_errors['duplicate_coordinates']:
-                    st.markdown('<div class="error-box"><strong>Multiple stations with identical coordinates</strong></div>', unsafe_allow_html=True)
-                    
-                    for error in potential_errors['duplicate_coordinates']:
-                        st.markdown(f"""
-                        <div class="detail-box">
-                            <p><strong>Coordinates:</strong> {error['coordinates']}<br>
-                            <strong>Number of different stations:</strong> {error['count']}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Create a DataFrame for display
-                        error_df = pd.DataFrame(error['sample_data'])
-                        st.dataframe(error_df, use_container_width=True)
-                
-                # Show duplicate addresses
-                if potential_errors['duplicate_addresses']:
-                    st.markdown('<div class="error-box"><strong>Multiple stations with identical addresses</strong></div>', unsafe_allow_html=True)
-                    
-                    for error in potential_errors['duplicate_addresses']:
-                        st.markdown(f"""
-                        <div class="detail-box">
-                            <p><strong>Address:</strong> {error['address']}<br>
-                            <strong>Number of different stations:</strong> {error['count']}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Create a DataFrame for display
-                        error_df = pd.DataFrame(error['sample_data'])
-                        st.dataframe(error_df, use_container_width=True)
-            
-            # Show results preview
-            st.markdown('<div class="section-header">🔍 Results Preview</div>', unsafe_allow_html=True)
-            st.dataframe(filtered_df, use_container_width=True)
-
-            # Download links
-            st.markdown('<div class="section-header">📥 Download Results</div>', unsafe_allow_html=True)
-            st.markdown(get_download_link(filtered_df, output_file, "Download Filtered CSV Results"), unsafe_allow_html=True)
-            st.markdown(get_download_link(result_df, f"raw_{output_file}", "Download Raw CSV Results (including potentially invalid entries)"), unsafe_allow_html=True)
-            
-            # Show a map of geocoded points
-            st.markdown('<div class="section-header">🗺️ Map Visualization</div>', unsafe_allow_html=True)
-            
-            # Filter only points with coordinates
-            map_data = filtered_df[filtered_df['Lat'].notna()].copy()
-            
-            # Rename columns for compatibility with st.map
-            map_data_for_display = map_data.copy()
-            map_data_for_display['latitude'] = map_data_for_display['Lat']
-            map_data_for_display['longitude'] = map_data_for_display['Lng']
-            
-            if not map_data.empty:
-                st.map(map_data_for_display[['latitude', 'longitude']])
-            else:
-                st.info("No valid coordinates to display on the map.")
-
-            # Show Maps links if available
-            if 'Maps_Link' in filtered_df.columns:
-                st.markdown('<div class="section-header">🔗 Maps Links</div>', unsafe_allow_html=True)
-                st.markdown('<div class="info-text">Click on any link below to open the location in Google Maps:</div>', unsafe_allow_html=True)
-                # Display only the first 10 links to avoid cluttering the UI
-                links_df = filtered_df[filtered_df['Maps_Link'].notna()].head(50)
-                for idx, row in links_df.iterrows():
-                    location_name = row[name_column] if pd.notna(row[name_column]) else "Unknown location"
-                    maps_link = row['Maps_Link']
-                    st.markdown(f'<a href="{maps_link}" target="_blank">🗺️ {location_name}</a>', unsafe_allow_html=True)
-                if len(links_df) < len(filtered_df[filtered_df['Maps_Link'].notna()]):
-                    st.info(f"Showing {len(links_df)} of {len(filtered_df[filtered_df['Maps_Link'].notna()])} available map links. Download the CSV to access all links.")
-    
-    except Exception as e:
-        st.error(f"❌ Error processing the file: {str(e)}")
-else:
-    # Show instructions when no file is uploaded
-    st.markdown("""
-    <div class="info-text">
-        <p>📝 <strong>Instructions:</strong></p>
-        <ol>
-            <li>🌐 Choose a geocoding provider in the sidebar</li>
-            <li>🔑 If you choose Google Maps, enter your Google Maps API key</li>
-            <li>🌍 Specify a country to narrow down geocoding results (recommended)</li>
-            <li>📂 Upload a CSV file containing station names</li>
-            <li>🛠️ Select the appropriate columns for station name and city (if available)</li>
-            <li>📍 Click "Get Coordinates" to start processing</li>
-        </ol>
-        <p>✨ The tool will add latitude, longitude, address and Maps link columns to your data and save intermediate results every 10 locations.</p>
-        <p>❌ Invalid results (where the address is just the country name) will be automatically filtered.</p>
-        <p>⚠️ Potential errors (when multiple different stations have identical coordinates or addresses) will be flagged.</p>
-    </div>
-    """, unsafe_allow_html=True)
-
-# Footer
-st.markdown("---")
-st.markdown('<div style="text-align: center; color: #9E9E9E; font-size: 0.8rem;"> Сделано с ❤️ Камиллой | Built with ❤️ by Camille</div>', unsafe_allow_html=True)
+import streamlit as st
+import pandas as pd
+import io
+import os
+import requests
+import shelve
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from pathlib import PurePath
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from geocoding_functions import get_coordinates_for_locations, display_summary, GEOCODE_ENDPOINT, _country_terms
+from nominatim_geocoding import get_coordinates_with_nominatim, NOMINATIM_ENDPOINT
+
+# Shared HTTP session so all geocoding requests reuse the same TCP/TLS
+# connections instead of handshaking once per row
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# Set page config
+st.set_page_config(
+    page_title="Get Station Coordinates",
+    page_icon="🌎",
+    layout="wide"
+)
+
+# Custom CSS to improve the appearance (hoisted to a constant and injected
+# once per session instead of on every rerun)
+CSS = """
+<style>
+    .main-header {
+        font-size: 2.5rem;
+        font-weight: 700;
+        color: #1E88E5;
+        margin-bottom: 1rem;
+        text-align: center;
+    }
+    .section-header {
+        font-size: 1.5rem;
+        font-weight: 600;
+        color: #0D47A1;
+        margin-top: 1.5rem;
+        margin-bottom: 1rem;
+    }
+    .info-text {
+        font-size: 1rem;
+        color: #424242;
+        margin-bottom: 1rem;
+    }
+    .success-box {
+        background-color: #E8F5E9;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        border-left: 0.5rem solid #43A047;
+        margin: 1rem 0;
+    }
+    .warning-box {
+        background-color: #FFF8E1;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        border-left: 0.5rem solid #FFA000;
+        margin: 1rem 0;
+    }
+    .error-box {
+        background-color: #FFEBEE;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        border-left: 0.5rem solid #E53935;
+        margin: 1rem 0;
+    }
+    .detail-box {
+        background-color: #E3F2FD;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        margin: 0.5rem 0;
+    }
+    .provider-box {
+        display: flex;
+        align-items: center;
+        gap: 1rem;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        margin: 1rem 0;
+        box-shadow: 0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24);
+    }
+    .provider-box.selected {
+        border: 2px solid #1E88E5;
+        background-color: #E3F2FD;
+    }
+    .provider-logo {
+        width: 50px;
+        height: 50px;
+        object-fit: contain;
+    }
+    .emoji {
+        font-size: 1.2rem;
+        margin-right: 0.5rem;
+    }
+</style>
+"""
+
+# Emitted on every run: Streamlit prunes elements that are not re-emitted on
+# a rerun, so a once-per-session guard would drop the styles after the first
+# widget interaction
+st.markdown(CSS, unsafe_allow_html=True)
+
+# App title and description
+st.markdown('<div class="main-header">🌍 Get Station Coordinates Tool</div>', unsafe_allow_html=True)
+
+st.markdown("<br><br>", unsafe_allow_html=True)  # Add even more vertical space
+
+# Add attention message
+st.markdown("""
+<div class="warning-box">
+    <strong>⚠️ Attention:</strong> This tool is not 100% reliable. It is intended to help map stations for integrations that use the "points" system (such as Redbus), or integrations that do not show coordinates and addresses to customers.<br>
+    For detailed information on how the tool works, please refer to the <a href="https://one2go.atlassian.net/wiki/x/GwCE-g" target="_blank">Confluence documentation</a>.
+</div>
+""", unsafe_allow_html=True)
+
+# On-disk geocoding cache so repeated stations (within a file or across runs)
+# skip the API entirely
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.geocode_cache')
+
+def normalize_cache_part(value):
+    if value is None or pd.isna(value):
+        return ''
+    value = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(value.lower().split())
+
+# Vectorized version of normalize_cache_part for whole columns
+def normalize_text_series(series):
+    return (
+        series.astype('string')
+        .str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('ascii')
+        .str.lower()
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+def make_cache_key(provider, mode, name, city, country):
+    # mode captures the provider option that changes results (locality filter
+    # for Google, settlement lock for Nominatim) so runs with opposite
+    # settings never serve each other's entries
+    return '|'.join([provider, mode, normalize_cache_part(name), normalize_cache_part(city), normalize_cache_part(country)])
+
+# Results collected by the background prewarm thread, folded into the on-disk
+# cache by the main thread on the next button press (shelve does not like
+# concurrent writers). Module globals are rebound on every Streamlit rerun, so
+# the store lives behind st.cache_resource, which survives reruns and is
+# shared with the worker thread; writers take the lock.
+@st.cache_resource
+def _prewarm_store():
+    return {'lock': threading.Lock(), 'results': {}}
+
+def geocode_single(provider, name, city, country, api_key, mode):
+    """Geocode one (name, city) pair; returns (lat, lng, address, maps_link) or None."""
+    query = f"{name}, {city}" if city else str(name)
+    if country:
+        query += f", {country}"
+    if provider == "google":
+        params = {'address': query, 'key': api_key}
+        # Match the main run's settings so cached entries reflect the mode
+        if mode == "locality":
+            params['components'] = f"locality:{name}"
+        results = SESSION.get(GEOCODE_ENDPOINT, params=params, timeout=10).json().get('results', [])
+        if not results:
+            return None
+        location = results[0]['geometry']['location']
+        lat, lng = location['lat'], location['lng']
+        address = results[0]['formatted_address']
+    else:
+        params = {'q': query, 'format': 'json', 'limit': 1}
+        if mode == "settlement":
+            params['extratags'] = 1
+            params['featureType'] = 'settlement'
+        headers = {'User-Agent': 'StationGeocodingTool/1.0'}
+        results = SESSION.get(NOMINATIM_ENDPOINT, params=params, headers=headers, timeout=10).json()
+        if not results:
+            return None
+        lat, lng = float(results[0]['lat']), float(results[0]['lon'])
+        address = results[0]['display_name']
+    return (lat, lng, address, f"https://www.google.com/maps?q={lat},{lng}")
+
+def prewarm_cache(pairs, country, provider, api_key, mode, stop_event):
+    """Geocode the most frequent stations in the background so they are cache
+    hits by the time the user presses the button. Best effort only; exits as
+    soon as stop_event is set so it never competes with a real run for
+    rate-limit slots."""
+    store = _prewarm_store()
+    for name, city in pairs:
+        if stop_event.is_set():
+            return
+        key = make_cache_key(provider, mode, name, city, country)
+        with store['lock']:
+            if key in store['results']:
+                continue
+        try:
+            result = geocode_single(provider, name, city, country, api_key, mode)
+        except Exception:
+            return
+        # Same guard as the provider cache: a country-only address must never
+        # become a durable cache hit that skips validation on future runs
+        if result is not None and str(result[2]).strip().lower() not in _country_terms(country):
+            with store['lock']:
+                store['results'][key] = result
+        # Respect each provider's rate limits even in the background
+        time.sleep(1.1 if provider == "nominatim" else 0.1)
+
+# Cache the CSV parse on the file's bytes so widget interactions (which rerun
+# the whole script) don't re-parse the upload
+@st.cache_data(show_spinner=False)
+def load_csv(file_bytes):
+    try:
+        return pd.read_csv(io.BytesIO(file_bytes), engine='pyarrow', dtype_backend='pyarrow')
+    except Exception:
+        return pd.read_csv(io.BytesIO(file_bytes))
+
+# Summary computation is deterministic given the results, so cache it across reruns too
+@st.cache_data(show_spinner=False)
+def summarize_results(result_df, country, name_column):
+    return display_summary(result_df, country=country, name_column=name_column)
+
+# Serialize results to CSV bytes once per DataFrame instead of on every rerun
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode()
+
+# Position of a value in a list without scanning it twice ('in' then 'index')
+def safe_index(lst, val, default=0):
+    try:
+        return lst.index(val)
+    except ValueError:
+        return default
+
+# Everything below the progress bar lives in a fragment so widget
+# interactions after geocoding only re-run this section, not the whole script
+@st.fragment
+def render_results(result_df, filtered_df, summary, name_column, output_file):
+    # Show summary
+    st.markdown('<div class="section-header">📊 Results Summary</div>', unsafe_allow_html=True)
+    st.markdown(f"""
+    <div class="success-box">
+        <p>✅ <strong>Processing completed!</strong></p>
+        <p>Total locations: {summary['total_locations']}</p>
+        <p>Locations with coordinates: {summary['locations_with_coordinates']} ({summary['success_rate']:.1f}%)</p>
+        <p>Locations without coordinates: {summary['locations_without_coordinates']} ({100-summary['success_rate']:.1f}%)</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Check for potential errors
+    potential_errors = summary['potential_errors']
+    
+    # Display potential errors if any
+    if potential_errors['duplicate_coordinates'] or potential_errors['duplicate_addresses']:
+        st.markdown('<div class="section-header">⚠️ Potential Errors Detected</div>', unsafe_allow_html=True)
+        
+        st.markdown("""
+        <div class="warning-box">
+            <p>⚠️ <strong>Warning:</strong> The following potential errors were detected:</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Show duplicate coordinates
+        if potential_errors['duplicate_coordinates']:
+            st.markdown('<div class="error-box"><strong>Multiple stations with identical coordinates</strong></div>', unsafe_allow_html=True)
+            
+            for error in potential_errors['duplicate_coordinates']:
+                st.markdown(f"""
+                <div class="detail-box">
+                    <p><strong>Coordinates:</strong> {error['coordinates']}<br>
+                    <strong>Number of different stations:</strong> {error['count']}</p>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                # sample_data is already a DataFrame slice, display it directly
+                st.dataframe(error['sample_data'], use_container_width=True)
+
+        # Show duplicate addresses
+        if potential_errors['duplicate_addresses']:
+            st.markdown('<div class="error-box"><strong>Multiple stations with identical addresses</strong></div>', unsafe_allow_html=True)
+            
+            for error in potential_errors['duplicate_addresses']:
+                st.markdown(f"""
+                <div class="detail-box">
+                    <p><strong>Address:</strong> {error['address']}<br>
+                    <strong>Number of different stations:</strong> {error['count']}</p>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                st.dataframe(error['sample_data'], use_container_width=True)
+
+    # Show results preview
+    st.markdown('<div class="section-header">🔍 Results Preview</div>', unsafe_allow_html=True)
+    st.dataframe(filtered_df.head(200), use_container_width=True)
+    st.caption(f"Showing {min(len(filtered_df), 200)} of {len(filtered_df):,} rows")
+
+    # Download buttons
+    st.markdown('<div class="section-header">📥 Download Results</div>', unsafe_allow_html=True)
+    st.download_button("📥 Download Filtered CSV Results", to_csv_bytes(filtered_df),
+                       file_name=output_file, mime='text/csv')
+    st.download_button("📥 Download Raw CSV Results (including potentially invalid entries)",
+                       to_csv_bytes(result_df), file_name=f"raw_{output_file}", mime='text/csv')
+    
+    # Show a map of geocoded points
+    st.markdown('<div class="section-header">🗺️ Map Visualization</div>', unsafe_allow_html=True)
+    
+    # Filter only points with coordinates and rename for st.map in one pass
+    map_data_for_display = (
+        filtered_df.loc[filtered_df['Lat'].notna(), ['Lat', 'Lng']]
+        .rename(columns={'Lat': 'latitude', 'Lng': 'longitude'})
+    )
+
+    if not map_data_for_display.empty:
+        st.map(map_data_for_display)
+    else:
+        st.info("No valid coordinates to display on the map.")
+
+    # Show Maps links if available
+    if 'Maps_Link' in filtered_df.columns:
+        st.markdown('<div class="section-header">🔗 Maps Links</div>', unsafe_allow_html=True)
+        st.markdown('<div class="info-text">Click on any link below to open the location in Google Maps:</div>', unsafe_allow_html=True)
+        # Filter the rows that have a link once, then display only the first 50,
+        # built as a single markdown block instead of one widget call per link
+        have_link = filtered_df[filtered_df['Maps_Link'].notna()]
+        links_df = have_link.head(50)
+        html_links = '<br>'.join(
+            f'<a href="{link}" target="_blank">🗺️ {name}</a>'
+            for name, link in zip(links_df[name_column].fillna("Unknown location"), links_df['Maps_Link'])
+        )
+        st.markdown(html_links, unsafe_allow_html=True)
+        if len(links_df) < len(have_link):
+            st.info(f"Showing {len(links_df)} of {len(have_link)} available map links. Download the CSV to access all links.")
+
+
+# Sidebar for inputs
+with st.sidebar:
+    st.markdown('<div class="section-header">⚙️ Configuration</div>', unsafe_allow_html=True)
+    
+    # Geocoding provider selection
+    st.markdown("### Choose a Geocoding Provider")
+    
+    # Use a single radio button for provider selection
+    provider = st.radio(
+        "Select a provider:",
+        ["Google Maps API", "Nominatim (Free)"],
+        index=0 if "provider" not in st.session_state or st.session_state.provider == "google" else 1,
+        key="provider_radio"
+    )
+    
+    # Update session state based on selection
+    if provider == "Google Maps API":
+        st.session_state.provider = "google"
+    else:
+        st.session_state.provider = "nominatim"
+    
+    # Provider description
+    if st.session_state.provider == "google":
+        st.markdown("""
+        <div class="info-text">
+            <strong>Google Maps API</strong><br>
+            ✓ High accuracy<br>
+            ✓ Consistent results<br>
+            ❌ Requires an API key<br>
+            ❌ Only 3000 free requests per month
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # API Key input (only for Google Maps)
+        api_key = st.text_input("Google Maps API Key", help="Enter your Google Maps API key")
+        
+        # Nouvelle option : search without locality filter
+        search_without_locality_filter = st.checkbox(
+            "Search without locality filter",
+            value=False,
+            help="If enabled, the search will be performed without restricting to the locality. This may maximize results but can lead to less relevant matches. If disabled, the search will use the locality filter for more precise results."
+        )
+    else:
+        st.markdown("""
+        <div class="info-text">
+            <strong>Nominatim / OpenStreetMap</strong><br>
+            ✓ Completely free<br>
+            ✓ No API key required<br>
+            ❌ Accuracy is really not as good<br>
+            ❌ Slower<br>
+        </div>
+        """, unsafe_allow_html=True)
+        api_key = None  # Not needed for Nominatim
+
+        # Option à cocher pour restreindre à settlement
+        lock_to_settlement = st.checkbox(
+            "Restrict search to locality only",
+            value=False,
+            help="If enabled, only results classified as settlements (cities, towns, villages, etc.) will be returned by Nominatim. May improve relevance for locality searches."
+        )
+    
+    # Common settings
+    st.markdown("### Common Settings")
+    
+    # Country input (optional)
+    country = st.text_input("Country (optional but recommended)", 
+                            help="Specify the country to narrow down geocoding results (e.g., France, Belgium, Canada)")
+    
+    # Output file name
+    output_filename = st.text_input("Output File Name", 
+                                   value="geocoding_results.csv", 
+                                   help="Name of the output CSV file")
+    
+    # Error detection threshold
+    error_threshold = st.number_input("Error Detection Threshold", 
+                                     min_value=2, 
+                                     value=5, 
+                                     help="Number of identical coordinates/addresses with different station names to flag as a potential error")
+
+# Main content
+
+
+# File uploader
+uploaded_file = st.file_uploader("Upload a CSV file with station names", type=["csv"])
+
+if uploaded_file is not None:
+    try:
+        # Bind the selected provider once instead of reading session state
+        # on every reference in the handler below
+        provider_key = st.session_state.provider
+
+        # The provider option that changes what a query returns, folded into
+        # every cache key so opposite settings never share entries
+        if provider_key == "google":
+            mode_part = "nolocality" if search_without_locality_filter else "locality"
+        else:
+            mode_part = "settlement" if lock_to_settlement else "free"
+
+        # Read the uploaded file (cached across reruns on the file's bytes)
+        df = load_csv(uploaded_file.getvalue())
+        
+        # Show dataframe preview
+        st.markdown('<div class="section-header">👀 Data Preview</div>', unsafe_allow_html=True)
+        # Only ship a slice to the browser; serializing the full frame freezes the UI on large uploads
+        st.dataframe(df.head(200), use_container_width=True)
+        st.caption(f"Showing {min(len(df), 200)} of {len(df):,} rows")
+        
+        # Column selection
+        st.markdown('<div class="section-header">🛠️ Column Selection</div>', unsafe_allow_html=True)
+        
+        available_columns = df.columns.tolist()
+        
+        # Default to 'remote_name' if available, otherwise let user select
+        name_column = st.selectbox("Select the column for location names:", available_columns, index=safe_index(available_columns, 'remote_name'))
+
+        # Default to 'remote_city_name' if available, otherwise let user select
+        city_column_options = ["None"] + available_columns
+        city_column = st.selectbox("Select the column for city names (optional):", city_column_options, index=safe_index(city_column_options, 'remote_city_name'))
+        
+        # Convert "None" to None
+        city_column = None if city_column == "None" else city_column
+
+        # Warm the cache for the top repeated stations in the background while
+        # the user finishes configuring the run (once per upload/configuration)
+        prewarm_token = (uploaded_file.name, uploaded_file.size, provider_key, mode_part, country, name_column, city_column)
+        if st.session_state.get('_prewarm_token') != prewarm_token and (provider_key != "google" or api_key):
+            if city_column:
+                top_pairs = df[[name_column, city_column]].value_counts().head(50).index.tolist()
+            else:
+                top_pairs = [(name, None) for name in df[name_column].value_counts().head(50).index]
+            # Stop any worker from a previous configuration before starting
+            previous_stop = st.session_state.get('_prewarm_stop')
+            if previous_stop is not None:
+                previous_stop.set()
+            stop_event = threading.Event()
+            threading.Thread(
+                target=prewarm_cache,
+                args=(top_pairs, country, provider_key, api_key, mode_part, stop_event),
+                daemon=True
+            ).start()
+            st.session_state['_prewarm_stop'] = stop_event
+            st.session_state['_prewarm_token'] = prewarm_token
+
+        # Process button
+        button_label = "📍 Get Coordinates"
+        if provider_key == "google":
+            button_label += " (Google Maps)"
+            if not api_key:
+                st.error("Please enter your Google Maps API key")
+                can_process = False
+            else:
+                can_process = True
+        else:
+            button_label += " (Nominatim)"
+            can_process = True
+            
+        if st.button(button_label) and can_process:
+            # Stop the background prewarm first so it cannot compete with the
+            # main run for rate-limit slots (public Nominatim allows 1 req/s)
+            prewarm_stop = st.session_state.get('_prewarm_stop')
+            if prewarm_stop is not None:
+                prewarm_stop.set()
+
+            # Create progress message
+            progress_message = st.empty()
+            progress_message.info("Processing started... This may take time for large datasets.")
+
+            # Progress bar
+            progress_bar = st.progress(0, text="Geocoding in progress...")
+
+            # Define output file path (in the same directory)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            provider_name = "google" if provider_key == "google" else "nominatim"
+            # PurePath.stem only drops the final suffix, so names like foo.bar.csv keep their prefix
+            output_file = f"{PurePath(output_filename).stem}_{provider_name}_{timestamp}.csv"
+
+            # Progress callback
+            def update_progress(current, total):
+                progress = current / total
+                progress_bar.progress(progress, text=f"Geocoding: {current}/{total}")
+
+            # Normalize names and cities once, vectorized, and derive the cache keys
+            norm_name = normalize_text_series(df[name_column]).fillna('')
+            if city_column:
+                norm_city = normalize_text_series(df[city_column]).fillna('')
+            else:
+                norm_city = pd.Series('', index=df.index, dtype='string')
+            country_part = normalize_cache_part(country)
+
+            # Look up previously geocoded rows in the on-disk cache
+            cache_keys = (provider_name + '|' + mode_part + '|' + norm_name + '|' + norm_city + '|' + country_part).tolist()
+            # Snapshot whatever the background prewarm thread has picked up
+            store = _prewarm_store()
+            with store['lock']:
+                prewarmed = list(store['results'].items())
+            with shelve.open(CACHE_PATH) as cache:
+                # Fold the prewarmed results into the on-disk cache
+                for key, value in prewarmed:
+                    if key not in cache:
+                        cache[key] = value
+                cache_hits = {pos: cache[key] for pos, key in enumerate(cache_keys) if key in cache}
+
+            miss_positions = [pos for pos in range(len(df)) if pos not in cache_hits]
+            miss_df = df.iloc[miss_positions]
+
+            # Deduplicate the misses so each unique (name, city) pair is geocoded once
+            dedupe_keys = [name_column] + ([city_column] if city_column else [])
+            unique_df = miss_df.drop_duplicates(subset=dedupe_keys)
+
+            progress_message.info(
+                f"Geocoding {len(unique_df)} unique of {len(df)} rows "
+                f"({len(cache_hits)} served from cache)..."
+            )
+
+            # Process the unique cache misses with the selected provider
+            if unique_df.empty:
+                provider_df = unique_df
+            elif provider_key == "google":
+                # search_without_locality_filter n'existe que si Google Maps est sélectionné
+                provider_df = get_coordinates_for_locations(
+                    unique_df,
+                    output_file,
+                    api_key,
+                    country=country,
+                    name_column=name_column,
+                    city_column=city_column,
+                    progress_callback=update_progress,
+                    search_without_locality_filter=search_without_locality_filter,
+                    session=SESSION
+                )
+            else:  # Nominatim / OSM
+                provider_df = get_coordinates_with_nominatim(
+                    unique_df,
+                    output_file,
+                    country=country,
+                    name_column=name_column,
+                    city_column=city_column,
+                    progress_callback=update_progress,
+                    lock_to_settlement=lock_to_settlement,  # <-- Passe l'option ici
+                    session=SESSION
+                )
+
+            # Reassemble the full result: provider output for misses, cached values for hits
+            result_df = df.copy()
+            for col in [c for c in provider_df.columns if c not in result_df.columns]:
+                result_df[col] = None
+            for col in ['Lat', 'Lng', 'Address', 'Maps_Link']:
+                if col not in result_df.columns:
+                    result_df[col] = None
+            if not provider_df.empty:
+                # Broadcast the unique results back to every duplicate miss
+                # row. The write-back list is fixed, not a set-difference
+                # against the upload's columns: re-uploading a results CSV
+                # must refresh its stale geocode columns, not keep them
+                geocode_columns = ['Lat', 'Lng', 'Address', 'Maps_Link', 'OSM_ID', 'OSM_Type', 'Locality_Filter']
+                provider_cols = [c for c in geocode_columns if c in provider_df.columns]
+                broadcast = miss_df[dedupe_keys].merge(
+                    provider_df[dedupe_keys + provider_cols].drop_duplicates(subset=dedupe_keys),
+                    on=dedupe_keys,
+                    how='left'
+                )
+                broadcast.index = miss_df.index
+                result_df.loc[miss_df.index, provider_cols] = broadcast[provider_cols].values
+            for pos, (lat, lng, address, link) in cache_hits.items():
+                idx = df.index[pos]
+                result_df.at[idx, 'Lat'] = lat
+                result_df.at[idx, 'Lng'] = lng
+                result_df.at[idx, 'Address'] = address
+                result_df.at[idx, 'Maps_Link'] = link
+
+            # Store fresh results so future runs hit the cache
+            if not provider_df.empty:
+                with shelve.open(CACHE_PATH) as cache:
+                    for pos in miss_positions:
+                        idx = df.index[pos]
+                        if pd.notna(result_df.at[idx, 'Lat']):
+                            cache[cache_keys[pos]] = (
+                                result_df.at[idx, 'Lat'],
+                                result_df.at[idx, 'Lng'],
+                                result_df.at[idx, 'Address'],
+                                result_df.at[idx, 'Maps_Link'],
+                            )
+
+            progress_bar.progress(1.0, text="Geocoding completed!")
+
+            # Get summary and filtered results (cached across reruns)
+            summary, filtered_df = summarize_results(result_df, country, name_column)
+            
+            # Update progress message
+            progress_message.success("Processing completed!")
+            
+            # Render the results section (scoped to a fragment)
+            render_results(result_df, filtered_df, summary, name_column, output_file)
+    
+    except Exception as e:
+        st.error(f"❌ Error processing the file: {str(e)}")
+else:
+    # Show instructions when no file is uploaded
+    st.markdown("""
+    <div class="info-text">
+        <p>📝 <strong>Instructions:</strong></p>
+        <ol>
+            <li>🌐 Choose a geocoding provider in the sidebar</li>
+            <li>🔑 If you choose Google Maps, enter your Google Maps API key</li>
+            <li>🌍 Specify a country to narrow down geocoding results (recommended)</li>
+            <li>📂 Upload a CSV file containing station names</li>
+            <li>🛠️ Select the appropriate columns for station name and city (if available)</li>
+            <li>📍 Click "Get Coordinates" to start processing</li>
+        </ol>
+        <p>✨ The tool will add latitude, longitude, address and Maps link columns to your data and save intermediate results every 10 locations.</p>
+        <p>❌ Invalid results (where the address is just the country name) will be automatically filtered.</p>
+        <p>⚠️ Potential errors (when multiple different stations have identical coordinates or addresses) will be flagged.</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+# Footer
+st.markdown("---")
+st.markdown('<div style="text-align: center; color: #9E9E9E; font-size: 0.8rem;"> Сделано с ❤️ Камиллой | Built with ❤️ by Camille</div>', unsafe_allow_html=True)
@@ -1,326 +1,583 @@
-import pandas as pd
-import googlemaps
-import time
-import os
-import pycountry
-
-def get_coordinates_for_locations(input_df, output_file, api_key, country=None, name_column='remote_name', city_column='remote_city_name', progress_callback=None, search_without_locality_filter=False):
-    """
-    Get GPS coordinates for each location from the DataFrame.
-
-    Parameters:
-    input_df (DataFrame): DataFrame containing locations
-    output_file (str): Path to save the results
-    api_key (str): Google Maps API key
-    country (str, optional): Country name to use for geocoding, can be None for global search
-    name_column (str): Column name containing location names
-    city_column (str): Column name containing city names
-    progress_callback (function, optional): Callback function to update progress, should accept two arguments (current, total)
-    search_without_locality_filter (bool): If True, search without locality filter; if False, use locality filter
-
-    Returns:
-    DataFrame: Original DataFrame with added coordinates
-    """
-    # Initialize Google Maps client
-    gmaps = googlemaps.Client(key=api_key)
-
-    # Create a copy of the input DataFrame
-    result_df = input_df.copy()
-    
-    # Add new columns for coordinates and address
-    if 'Lat' not in result_df.columns:
-        result_df['Lat'] = None
-    if 'Lng' not in result_df.columns:
-        result_df['Lng'] = None
-    if 'Address' not in result_df.columns:
-        result_df['Address'] = None
-    # Add Maps_Link column
-    if 'Maps_Link' not in result_df.columns:
-        result_df['Maps_Link'] = None
-    # Add Locality_Filter column
-    if 'Locality_Filter' not in result_df.columns:
-        result_df['Locality_Filter'] = None
-    
-    # Check if results file already exists to resume processing
-    processed_indices = set()
-    if os.path.exists(output_file):
-        try:
-            existing_results = pd.read_csv(output_file)
-            # Check if the existing results have the required columns
-            required_columns = ['Lat', 'Lng', 'Address', name_column]
-            if all(col in existing_results.columns for col in required_columns):
-                # Map the existing results to our result DataFrame
-                for idx, row in existing_results.iterrows():
-                    if pd.notna(row['Lat']) and pd.notna(row['Lng']):
-                        # Find matching rows in our result_df
-                        matching_rows = result_df[result_df[name_column] == row[name_column]]
-                        if not matching_rows.empty:
-                            for match_idx in matching_rows.index:
-                                result_df.at[match_idx, 'Lat'] = row['Lat']
-                                result_df.at[match_idx, 'Lng'] = row['Lng']
-                                result_df.at[match_idx, 'Address'] = row['Address']
-                                processed_indices.add(match_idx)
-                
-                print(f"Resuming process: {len(processed_indices)} locations already processed.")
-        except Exception as e:
-            print(f"Error reading existing file: {e}")
-
-    # Filter to process only locations not yet processed
-    rows_to_process = [idx for idx in result_df.index if idx not in processed_indices]
-    
-    print(f"Number of locations to process: {len(rows_to_process)}")
-
-    # Process each location
-    for i, idx in enumerate(rows_to_process):
-        row = result_df.loc[idx]
-        
-        # Get location name and city
-        location_name = row[name_column] if pd.notna(row[name_column]) else ""
-        city_name = row[city_column] if city_column in result_df.columns and pd.notna(row[city_column]) else ""
-        
-        # Create query string by combining location name and city
-        if city_name:
-            query = f"{location_name}, {city_name}"
-        else:
-            query = location_name
-            
-        # Add country if specified
-        if country:
-            query += f", {country}"
-            
-        try:
-            print(f"[{i+1}/{len(rows_to_process)}] Processing: {query}")
-
-            def is_valid_geocode_result(geocode_result, country):
-                if not geocode_result:
-                    print("No geocode result")
-                    return False
-                formatted_address = geocode_result[0]['formatted_address'].strip().lower()
-                print(f"Checking formatted_address: {formatted_address}")
-                if not formatted_address:
-                    print("Empty formatted_address")
-                    return False
-                country_terms = []
-                if country:
-                    country_terms.append(country.strip().lower())
-                import pycountry
-                for pycountry_country in pycountry.countries:
-                    country_terms.append(pycountry_country.name.lower())
-                    if hasattr(pycountry_country, 'official_name') and pycountry_country.official_name:
-                        country_terms.append(pycountry_country.official_name.lower())
-                    if pycountry_country.alpha_2:
-                        country_terms.append(pycountry_country.alpha_2.lower())
-                    if pycountry_country.alpha_3:
-                        country_terms.append(pycountry_country.alpha_3.lower())
-                if formatted_address in country_terms:
-                    print("Address is just a country term, invalid")
-                    return False
-                return True
-
-            used_locality_filter = None
-
-            if search_without_locality_filter:
-                # Recherche SANS filtre locality
-                geocode_result = gmaps.geocode(query)
-                used_locality_filter = False
-            else:
-                # Recherche AVEC filtre locality
-                geocode_result = gmaps.geocode(
-                    query,
-                    components={"locality": location_name}
-                )
-                used_locality_filter = True
-
-            if is_valid_geocode_result(geocode_result, country):
-                location = geocode_result[0]['geometry']['location']
-                lat, lng = location['lat'], location['lng']
-                formatted_address = geocode_result[0]['formatted_address']
-                result_df.at[idx, 'Lat'] = lat
-                result_df.at[idx, 'Lng'] = lng
-                result_df.at[idx, 'Address'] = formatted_address
-                result_df.at[idx, 'Maps_Link'] = f"https://www.google.com/maps?q={lat},{lng}"
-            else:
-                print(f"No valid results found for: {query}")
-
-            # Toujours écrire True ou False dans la colonne, jamais None
-            result_df.at[idx, 'Locality_Filter'] = bool(used_locality_filter)
-
-            # Save progressively
-            if (i + 1) % 10 == 0 or i == len(rows_to_process) - 1:
-                result_df.to_csv(output_file, index=False)
-                print(f"Intermediate save completed: {i+1} locations processed")
-
-            # Pause to respect API limits
-            time.sleep(0.3)
-
-            # Update progress bar if callback is provided
-            if progress_callback:
-                progress_callback(i + 1, len(rows_to_process))
-
-        except Exception as e:
-            print(f"Error processing {query}: {e}")
-            
-            # Save in case of error
-            result_df.to_csv(output_file, index=False)
-
-            # Wait a bit longer in case of error (might be API limit)
-            time.sleep(2)
-
-            # Update progress bar on error as well
-            if progress_callback:
-                progress_callback(i + 1, len(rows_to_process))
-
-    # Save final result
-    result_df.to_csv(output_file, index=False)
-    print(f"Processing completed! Results saved to {output_file}")
-
-    return result_df
-
-def filter_invalid_results(df, country=None):
-    """
-    Filter out incorrect results where the address only contains the country name.
-    
-    Parameters:
-    df (DataFrame): DataFrame containing geocoding results
-    country (str, optional): Country name used for geocoding
-    
-    Returns:
-    DataFrame: Filtered DataFrame without invalid results
-    """
-    filtered_df = df.copy()
-    
-    # Only process rows that have an address
-    mask = filtered_df['Address'].notna()
-    
-    # Create a list of potential country-only matches to filter out
-    country_terms = []
-    if country:
-        country_terms.append(country.strip().lower())
-        
-    # Add countries from pycountry
-    for pycountry_country in pycountry.countries:
-        country_terms.append(pycountry_country.name.lower())
-        if hasattr(pycountry_country, 'official_name') and pycountry_country.official_name:
-            country_terms.append(pycountry_country.official_name.lower())
-        if pycountry_country.alpha_2:
-            country_terms.append(pycountry_country.alpha_2.lower())
-        if pycountry_country.alpha_3:
-            country_terms.append(pycountry_country.alpha_3.lower())
-    
-    # Filter out results where the address is just the country
-    for idx in filtered_df[mask].index:
-        address = str(filtered_df.at[idx, 'Address']).strip().lower()
-        
-        # Check if address only contains country information
-        if any(address == country_term for country_term in country_terms):
-            print(f"Invalid result detected - Address is just country name: {filtered_df.at[idx, 'Address']}")
-            filtered_df.at[idx, 'Lat'] = None
-            filtered_df.at[idx, 'Lng'] = None
-            filtered_df.at[idx, 'Address'] = None
-    
-    return filtered_df
-
-def find_potential_errors(df, name_column='remote_name', threshold=5):
-    """
-    Find potential errors where multiple different stations have the same coordinates or address.
-    
-    Parameters:
-    df (DataFrame): DataFrame containing geocoding results
-    name_column (str): Column name containing location names
-    threshold (int): Minimum number of occurrences to flag as potential error
-    
-    Returns:
-    dict: Dictionary with duplicate coordinates and addresses
-    """
-    potential_errors = {
-        'duplicate_coordinates': [],
-        'duplicate_addresses': []
-    }
-    
-    # Only consider rows with coordinates and addresses
-    valid_df = df[(df['Lat'].notna()) & (df['Lng'].notna())].copy()
-    
-    if valid_df.empty:
-        return potential_errors
-    
-    # Create a combined coordinate column for easier grouping
-    valid_df['coord_key'] = valid_df['Lat'].astype(str) + ',' + valid_df['Lng'].astype(str)
-    
-    # Find duplicate coordinates
-    coord_counts = valid_df.groupby('coord_key')[name_column].apply(list).reset_index()
-    for _, row in coord_counts.iterrows():
-        unique_names = set(row[name_column])
-        if len(unique_names) >= threshold:
-            # Get sample data for these coordinates
-            sample_data = valid_df[valid_df['coord_key'] == row['coord_key']].drop_duplicates(subset=[name_column])
-            sample_data = sample_data[[name_column, 'Lat', 'Lng', 'Address']].head(10).to_dict('records')
-            
-            potential_errors['duplicate_coordinates'].append({
-                'coordinates': row['coord_key'],
-                'count': len(unique_names),
-                'sample_data': sample_data
-            })
-    
-    # Find duplicate addresses (excluding nulls)
-    valid_address_df = valid_df[valid_df['Address'].notna()]
-    if not valid_address_df.empty:
-        address_counts = valid_address_df.groupby('Address')[name_column].apply(list).reset_index()
-        for _, row in address_counts.iterrows():
-            unique_names = set(row[name_column])
-            if len(unique_names) >= threshold:
-                # Get sample data for this address
-                sample_data = valid_address_df[valid_address_df['Address'] == row['Address']].drop_duplicates(subset=[name_column])
-                sample_data = sample_data[[name_column, 'Lat', 'Lng', 'Address']].head(10).to_dict('records')
-                
-                potential_errors['duplicate_addresses'].append({
-                    'address': row['Address'],
-                    'count': len(unique_names),
-                    'sample_data': sample_data
-                })
-    
-    return potential_errors
-
-def display_summary(result_df, country=None, name_column='remote_name'):
-    """
-    Display a summary of the geocoding results.
-    
-    Parameters:
-    result_df (DataFrame): DataFrame containing the geocoding results
-    country (str, optional): Country name used for geocoding
-    name_column (str): Column name containing location names
-    
-    Returns:
-    dict: Dictionary containing summary statistics and potential errors
-    """
-    # Au lieu de filtrer (supprimer) les lignes avec des adresses invalides, on met à None les colonnes calculées
-    updated_df = result_df.copy()
-    country_term = (country or "").lower().strip()
-    # Pour chaque ligne, si l'adresse est vide ou égale au nom du pays, on remet à None les colonnes de géocodage
-    for idx, row in updated_df.iterrows():
-        addr = str(row['Address']).strip().lower() if pd.notna(row['Address']) else ""
-        if addr == "" or addr == country_term:
-            updated_df.at[idx, 'Lat'] = None
-            updated_df.at[idx, 'Lng'] = None
-            updated_df.at[idx, 'Address'] = None
-            if 'Maps_Link' in updated_df.columns:
-                updated_df.at[idx, 'Maps_Link'] = None
-
-    total_locations = len(updated_df)
-    locations_with_coordinates = updated_df['Lat'].notna().sum()
-    locations_without_coordinates = total_locations - locations_with_coordinates
-    success_rate = (locations_with_coordinates / total_locations) * 100 if total_locations > 0 else 0
-    filtered_count = total_locations - locations_with_coordinates
-
-    potential_errors = find_potential_errors(updated_df, name_column)
-    
-    summary = {
-        "total_locations": total_locations,
-        "locations_with_coordinates": locations_with_coordinates,
-        "locations_without_coordinates": locations_without_coordinates,
-        "success_rate": success_rate,
-        "clean_and_correct_results": filtered_count,  # Key renommée ici
-        "potential_errors": potential_errors,
-        "sample_results": updated_df.head(5).to_dict('records')
-    }
-    
-    return summary, updated_df
+import asyncio
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import aiohttp
+import os
+import pickle
+import random
+import sqlite3
+import time
+import pycountry
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Share column buffers on copy and only duplicate them on write, so copying
+# a large input frame no longer doubles RSS up-front (pandas >= 2.0)
+try:
+    pd.options.mode.copy_on_write = True
+    _PANDAS_COW = True
+except AttributeError:
+    _PANDAS_COW = False
+
+# Dtypes for the result columns every provider produces
+_RESULT_DTYPES = {
+    'Lat': 'float64',
+    'Lng': 'float64',
+    'Address': 'string',
+    'Maps_Link': 'string',
+}
+
+# Dtypes used for the geocoding columns in checkpoint files so every
+# appended row group shares the same Arrow schema; the Google path also
+# records which locality-filter mode produced each row
+_CHECKPOINT_DTYPES = {
+    **_RESULT_DTYPES,
+    'Locality_Filter': 'boolean',
+}
+
+def _ensure_columns(df, schema):
+    """
+    Add any missing columns from schema (column name -> dtype) as typed NA
+    series, so later code can assume the full schema without per-use checks.
+    """
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            fill = np.nan if dtype == 'float64' else pd.NA
+            df[column] = pd.Series(fill, index=df.index, dtype=dtype)
+
+def _build_country_terms():
+    # Walk pycountry's ~250 entries once at import instead of on every call
+    terms = set()
+    for pycountry_country in pycountry.countries:
+        terms.add(pycountry_country.name.lower())
+        if getattr(pycountry_country, 'official_name', None):
+            terms.add(pycountry_country.official_name.lower())
+        if pycountry_country.alpha_2:
+            terms.add(pycountry_country.alpha_2.lower())
+        if pycountry_country.alpha_3:
+            terms.add(pycountry_country.alpha_3.lower())
+    return frozenset(terms)
+
+def _load_or_build_terms():
+    # Walking pycountry's data file costs tens of milliseconds at import, so
+    # the derived set is pickled to the user cache dir, keyed on the pycountry
+    # version; any failure just falls back to rebuilding
+    version = getattr(pycountry, '__version__', 'unknown')
+    cache_dir = os.path.join(
+        os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+        'station_geocoding_tool',
+    )
+    cache_path = os.path.join(cache_dir, f'country_terms_{version}.pkl')
+    try:
+        with open(cache_path, 'rb') as fh:
+            terms = pickle.load(fh)
+        if isinstance(terms, frozenset):
+            return terms
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    terms = _build_country_terms()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as fh:
+            pickle.dump(terms, fh)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return terms
+
+# Every name/code an address could consist of when it is "just a country"
+_COUNTRY_TERMS = _load_or_build_terms()
+
+@lru_cache(maxsize=32)
+def _country_terms(country=None):
+    # The base set plus the user-supplied country name, resolved once per
+    # distinct country value instead of rebuilt for every address checked
+    if country:
+        return frozenset(_COUNTRY_TERMS | {country.strip().lower()})
+    return _COUNTRY_TERMS
+
+# Google Maps Geocoding REST endpoint
+GEOCODE_ENDPOINT = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# How many geocoding jobs are dispatched per asyncio.gather batch
+GEOCODE_BATCH_SIZE = 50
+
+# Maximum number of in-flight requests to the Geocoding API
+GEOCODE_MAX_CONCURRENCY = 10
+
+# Target request rate, just under Google's 50 QPS ceiling
+GEOCODE_MAX_QPS = 45
+
+# How many times a transient failure (timeout, 429/5xx, OVER_QUERY_LIMIT) is retried
+GEOCODE_MAX_ATTEMPTS = 3
+
+# Per-request deadline shared by every geocoding call
+GEOCODE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Persistent provider-level query cache lives next to this module
+GEOCODE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.geocode_cache.sqlite')
+
+class GeocodeCache:
+    """
+    Persistent query cache backed by SQLite so identical (name, city, country)
+    tuples skip the network, within a run and across runs.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH):
+        # autocommit + WAL so readers and the writer don't serialize each other
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache("
+            "key TEXT PRIMARY KEY, lat REAL, lng REAL, address TEXT, locality INTEGER)"
+        )
+
+    @staticmethod
+    def make_key(country, location_name, city_name, use_locality):
+        return f"{(country or '').strip().lower()}|{str(location_name).strip().lower()}|{str(city_name).strip().lower()}|{bool(use_locality)}"
+
+    def get(self, key):
+        return self._conn.execute(
+            "SELECT lat, lng, address, locality FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+
+    def set(self, key, lat, lng, address, locality):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache(key, lat, lng, address, locality) VALUES (?, ?, ?, ?, ?)",
+            (key, lat, lng, address, int(bool(locality)))
+        )
+
+    def close(self):
+        self._conn.close()
+
+def get_coordinates_for_locations(input_df, output_file, api_key, country=None, name_column='remote_name', city_column='remote_city_name', progress_callback=None, search_without_locality_filter=False, session=None):
+    """
+    Get GPS coordinates for each location from the DataFrame.
+
+    Parameters:
+    input_df (DataFrame): DataFrame containing locations
+    output_file (str): Path to save the results
+    api_key (str): Google Maps API key
+    country (str, optional): Country name to use for geocoding, can be None for global search
+    name_column (str): Column name containing location names
+    city_column (str): Column name containing city names
+    progress_callback (function, optional): Callback function to update progress, should accept two arguments (current, total)
+    search_without_locality_filter (bool): If True, search without locality filter; if False, use locality filter
+    session (requests.Session, optional): Accepted for compatibility; the async client manages its own connection pool
+
+    Returns:
+    DataFrame: Original DataFrame with added coordinates
+    """
+    # Create a copy of the input DataFrame; with copy-on-write the caller's
+    # column buffers are shared until a write actually touches them
+    result_df = input_df.copy(deep=False) if _PANDAS_COW else input_df.copy()
+
+    # Guarantee the geocoding columns once at entry, typed from the start so
+    # pandas keeps contiguous float64/StringArray buffers instead of object
+    # columns full of None; nothing downstream re-checks for their existence
+    _ensure_columns(result_df, _CHECKPOINT_DTYPES)
+
+    # Intermediate saves append row groups to a parquet sidecar instead of
+    # rewriting the whole frame as CSV every 10 rows; the CSV is written once
+    # at the end
+    checkpoint_file = f"{output_file}.partial.parquet"
+    checkpoint_writer = None
+    resumed_checkpoint = None
+
+    def write_checkpoint(indices):
+        nonlocal checkpoint_writer, resumed_checkpoint
+        batch = result_df.loc[indices].astype(_CHECKPOINT_DTYPES)
+        table = pa.Table.from_pandas(batch, preserve_index=True)
+        if checkpoint_writer is None:
+            checkpoint_writer = pq.ParquetWriter(checkpoint_file, table.schema, compression='zstd')
+            # Opening the writer truncated the file, so re-emit the row groups
+            # carried over from the interrupted run before appending new ones
+            if resumed_checkpoint is not None:
+                prior = pa.Table.from_pandas(resumed_checkpoint.astype(_CHECKPOINT_DTYPES), preserve_index=True)
+                if prior.schema != table.schema:
+                    prior = prior.cast(table.schema)
+                checkpoint_writer.write_table(prior)
+                resumed_checkpoint = None
+        elif table.schema != checkpoint_writer.schema:
+            table = table.cast(checkpoint_writer.schema)
+        checkpoint_writer.write_table(table)
+
+    # Check if a checkpoint or results file already exists to resume processing
+    processed_indices = set()
+    existing_results = None
+    if os.path.exists(checkpoint_file):
+        try:
+            existing_results = pd.read_parquet(checkpoint_file)
+            resumed_checkpoint = existing_results
+        except Exception as e:
+            print(f"Error reading existing checkpoint: {e}")
+    elif os.path.exists(output_file):
+        try:
+            existing_results = pd.read_csv(output_file)
+        except Exception as e:
+            print(f"Error reading existing file: {e}")
+
+    if existing_results is not None:
+        try:
+            # Check if the existing results have the required columns
+            required_columns = ['Lat', 'Lng', 'Address', name_column]
+            if all(col in existing_results.columns for col in required_columns):
+                # Map the existing results onto result_df with one hash join
+                # instead of a boolean scan per existing row
+                existing_valid = (
+                    existing_results.dropna(subset=['Lat', 'Lng'])
+                    .drop_duplicates(subset=[name_column], keep='last')
+                    .set_index(name_column)
+                )
+                names = result_df[name_column]
+                for col in ['Lat', 'Lng', 'Address']:
+                    result_df[col] = result_df[col].fillna(names.map(existing_valid[col]))
+                processed_indices = set(result_df.index[result_df['Lat'].notna() & result_df['Lng'].notna()])
+
+                print(f"Resuming process: {len(processed_indices)} locations already processed.")
+        except Exception as e:
+            print(f"Error mapping existing results: {e}")
+
+    # Filter to process only locations not yet processed
+    rows_to_process = [idx for idx in result_df.index if idx not in processed_indices]
+    
+    print(f"Number of locations to process: {len(rows_to_process)}")
+
+    # Build one geocoding job per unique query, serving anything the
+    # persistent cache already knows without touching the network. Rows that
+    # share the same (name, city) only hit the API once; the result is
+    # broadcast to every member of the group.
+    cache = GeocodeCache()
+    cached_results = {}
+    group_members = {}
+    jobs = []
+    # Pre-extract the two columns the loop reads as plain numpy arrays; a
+    # .loc[idx] per row would build a full Series copy just to read two cells
+    names = result_df[name_column].to_numpy()
+    cities = result_df[city_column].to_numpy() if city_column in result_df.columns else None
+    positions = result_df.index.get_indexer_for(rows_to_process)
+    for idx, pos in zip(rows_to_process, positions):
+        # Get location name and city
+        location_name = names[pos] if pd.notna(names[pos]) else ""
+        city_name = cities[pos] if cities is not None and pd.notna(cities[pos]) else ""
+
+        key = GeocodeCache.make_key(country, location_name, city_name, not search_without_locality_filter)
+        if key in group_members:
+            group_members[key].append(idx)
+            continue
+        group_members[key] = [idx]
+
+        cached = cache.get(key)
+        if cached is not None:
+            lat, lng, address, _ = cached
+            cached_results[key] = (lat, lng, address)
+            continue
+
+        # Create query string by combining location name and city
+        if city_name:
+            query = f"{location_name}, {city_name}"
+        else:
+            query = location_name
+
+        # Add country if specified
+        if country:
+            query += f", {country}"
+
+        jobs.append((key, query, location_name))
+
+    if cached_results:
+        indices = [idx for key in cached_results for idx in group_members[key]]
+        values = [cached_results[key] for key in cached_results for _ in group_members[key]]
+        result_df.loc[indices, ['Lat', 'Lng', 'Address']] = values
+        print(f"{len(indices)} locations served from the local cache")
+
+    # Toujours écrire True ou False dans la colonne, jamais None — one
+    # vectorized write for every processed row instead of per-row flags
+    result_df.loc[rows_to_process, 'Locality_Filter'] = not search_without_locality_filter
+
+    # Token bucket keeping total throughput just under the API's QPS ceiling;
+    # the semaphore alone only bounds how many requests are in flight
+    rate_lock = asyncio.Lock()
+    next_request_at = 0.0
+
+    async def wait_for_slot():
+        nonlocal next_request_at
+        async with rate_lock:
+            now = asyncio.get_running_loop().time()
+            delay = next_request_at - now
+            next_request_at = max(now, next_request_at) + 1.0 / GEOCODE_MAX_QPS
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def geocode_one(http, semaphore, key, query, location_name):
+        # Query the Geocoding API for a single unique query, bounded by the semaphore
+        params = {'address': query, 'key': api_key}
+        if not search_without_locality_filter:
+            # Recherche AVEC filtre locality
+            params['components'] = f"locality:{location_name}"
+        async with semaphore:
+            for attempt in range(GEOCODE_MAX_ATTEMPTS):
+                await wait_for_slot()
+                try:
+                    async with http.get(GEOCODE_ENDPOINT, params=params) as response:
+                        # Transient HTTP failures are worth retrying; 4xx are not
+                        if response.status in (429, 500, 502, 503, 504):
+                            response.raise_for_status()
+                        payload = await response.json()
+                    if payload.get('status') == 'OVER_QUERY_LIMIT':
+                        # The whole project is being throttled: back off harder
+                        await asyncio.sleep(min(8.0, 2.0 * 2 ** attempt) + random.random())
+                        continue
+                    # ZERO_RESULTS and other non-retryable statuses come back
+                    # as an empty results list and are not retried
+                    return key, query, payload.get('results', [])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if attempt == GEOCODE_MAX_ATTEMPTS - 1:
+                        print(f"Error processing {query}: {e}")
+                        break
+                    # Exponential backoff with jitter before the next attempt
+                    await asyncio.sleep(0.5 * 2 ** attempt + random.random() * 0.5)
+            return key, query, None
+
+    async def geocode_all():
+        # Cap the number of in-flight requests to stay under the provider's QPS limit
+        semaphore = asyncio.Semaphore(GEOCODE_MAX_CONCURRENCY)
+        completed = 0
+        pending_checkpoint = []
+        pending_results = {}
+        # Repaint the progress widget ~200 times per run (or at most every
+        # 100ms), not once per row — UI callbacks are costly when results
+        # arrive faster than the screen can usefully update
+        report_every = max(1, len(jobs) // 200)
+        last_report = 0.0
+
+        def flush_pending():
+            # Buffered write-back: one .loc assignment per checkpoint instead
+            # of four .at writes per row, broadcast to every row of each group
+            if pending_results:
+                indices = [idx for key in pending_results for idx in group_members[key]]
+                values = [pending_results[key] for key in pending_results for _ in group_members[key]]
+                result_df.loc[indices, ['Lat', 'Lng', 'Address']] = values
+                pending_results.clear()
+            if pending_checkpoint:
+                write_checkpoint(pending_checkpoint)
+                pending_checkpoint.clear()
+
+        # One session for the whole run: TCP+TLS connections to the API are
+        # pooled and kept alive across batches instead of re-handshaking
+        connector = aiohttp.TCPConnector(limit=100, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector, timeout=GEOCODE_TIMEOUT) as http:
+            # Dispatch in fixed-size batches so very large CSVs never hold
+            # one coroutine per row in memory at once. The final flush runs
+            # even if the loop dies mid-batch, so buffered results are never
+            # lost between checkpoints.
+            try:
+                for start in range(0, len(jobs), GEOCODE_BATCH_SIZE):
+                    batch = jobs[start:start + GEOCODE_BATCH_SIZE]
+                    tasks = [geocode_one(http, semaphore, key, query, location_name)
+                             for key, query, location_name in batch]
+                    for future in asyncio.as_completed(tasks):
+                        key, query, geocode_result = await future
+                        completed += 1
+
+                        # Store the raw result here and validate everything in
+                        # one vectorized pass after the run; the only per-row
+                        # check kept is the O(1) cache-poisoning guard
+                        if geocode_result:
+                            location = geocode_result[0]['geometry']['location']
+                            lat, lng = location['lat'], location['lng']
+                            formatted_address = geocode_result[0]['formatted_address']
+                            pending_results[key] = (lat, lng, formatted_address)
+                            if formatted_address.strip().lower() not in _country_terms(country):
+                                cache.set(key, lat, lng, formatted_address,
+                                          not search_without_locality_filter)
+                        else:
+                            print(f"No results found for: {query}")
+
+                        # Save progressively: append only the rows finished since the last save
+                        pending_checkpoint.extend(group_members[key])
+                        if completed % 10 == 0 or completed == len(jobs):
+                            flush_pending()
+                            print(f"Intermediate save completed: {completed} locations processed")
+
+                        # Update progress bar if callback is provided
+                        if progress_callback and (
+                            completed % report_every == 0
+                            or completed == len(jobs)
+                            or time.monotonic() - last_report > 0.1
+                        ):
+                            progress_callback(completed, len(jobs))
+                            last_report = time.monotonic()
+            finally:
+                flush_pending()
+
+    try:
+        if jobs:
+            asyncio.run(geocode_all())
+    finally:
+        cache.close()
+        if checkpoint_writer is not None:
+            checkpoint_writer.close()
+
+    # Build every Maps_Link in one vectorized pass (this also fills links for
+    # rows restored from a resume), then validate the addresses the same way
+    has_coords = result_df['Lat'].notna() & result_df['Lng'].notna()
+    result_df.loc[has_coords, 'Maps_Link'] = (
+        'https://www.google.com/maps?q='
+        + result_df.loc[has_coords, 'Lat'].astype('string')
+        + ','
+        + result_df.loc[has_coords, 'Lng'].astype('string')
+    )
+    result_df = filter_invalid_results(result_df, country)
+
+    # Save final result and drop the checkpoint now that the CSV is complete
+    result_df.to_csv(output_file, index=False)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    print(f"Processing completed! Results saved to {output_file}")
+
+    return result_df
+
+def filter_invalid_results(df, country=None):
+    """
+    Filter out incorrect results where the address only contains the country name.
+    
+    Parameters:
+    df (DataFrame): DataFrame containing geocoding results
+    country (str, optional): Country name used for geocoding
+    
+    Returns:
+    DataFrame: Filtered DataFrame without invalid results
+    """
+    filtered_df = df.copy()
+
+    # Country-only matches to filter out
+    country_terms = _country_terms(country)
+
+    # Null out results whose address is just a country term, in one vectorized pass
+    addresses = filtered_df['Address'].dropna().astype(str).str.strip().str.lower()
+    invalid = addresses[addresses.isin(country_terms)]
+    if not invalid.empty:
+        print(f"{len(invalid)} invalid results detected - address is just a country name")
+        reset_cols = ['Lat', 'Lng', 'Address'] + (['Maps_Link'] if 'Maps_Link' in filtered_df.columns else [])
+        filtered_df.loc[invalid.index, reset_cols] = None
+
+    return filtered_df
+
+def find_potential_errors(df, name_column='remote_name', threshold=5):
+    """
+    Find potential errors where multiple different stations have the same coordinates or address.
+    
+    Parameters:
+    df (DataFrame): DataFrame containing geocoding results
+    name_column (str): Column name containing location names
+    threshold (int): Minimum number of occurrences to flag as potential error
+    
+    Returns:
+    dict: Dictionary with duplicate coordinates and addresses
+    """
+    potential_errors = {
+        'duplicate_coordinates': [],
+        'duplicate_addresses': []
+    }
+    
+    # Only consider rows with coordinates and addresses
+    valid_df = df[(df['Lat'].notna()) & (df['Lng'].notna())]
+
+    if valid_df.empty:
+        return potential_errors
+
+    # Find duplicate coordinates: one vectorized pass counting distinct
+    # station names per coordinate pair
+    coord_counts = valid_df.groupby(['Lat', 'Lng'])[name_column].nunique()
+    hot_coords = coord_counts[coord_counts >= threshold]
+    if not hot_coords.empty:
+        # Pre-extract up to 10 distinct-name samples per coordinate pair in one
+        # pass instead of re-scanning the frame for every flagged group
+        coord_samples = (
+            valid_df.drop_duplicates(subset=['Lat', 'Lng', name_column])
+            .groupby(['Lat', 'Lng'])
+            .head(10)
+            .groupby(['Lat', 'Lng'])
+        )
+        for (lat, lng), count in hot_coords.items():
+            # Keep the sample as a DataFrame slice; converting every group to
+            # dicts-of-dicts up-front copies each cell into Python objects
+            sample_data = coord_samples.get_group((lat, lng))[[name_column, 'Lat', 'Lng', 'Address']]
+
+            potential_errors['duplicate_coordinates'].append({
+                'coordinates': f"{lat},{lng}",
+                'count': int(count),
+                'sample_data': sample_data
+            })
+
+    # Find duplicate addresses (excluding nulls), same single-pass pattern
+    valid_address_df = valid_df[valid_df['Address'].notna()]
+    if not valid_address_df.empty:
+        address_counts = valid_address_df.groupby('Address')[name_column].nunique()
+        hot_addresses = address_counts[address_counts >= threshold]
+        if not hot_addresses.empty:
+            address_samples = (
+                valid_address_df.drop_duplicates(subset=['Address', name_column])
+                .groupby('Address')
+                .head(10)
+                .groupby('Address')
+            )
+            for address, count in hot_addresses.items():
+                sample_data = address_samples.get_group(address)[[name_column, 'Lat', 'Lng', 'Address']]
+
+                potential_errors['duplicate_addresses'].append({
+                    'address': address,
+                    'count': int(count),
+                    'sample_data': sample_data
+                })
+
+    return potential_errors
+
+def display_summary(result_df, country=None, name_column='remote_name'):
+    """
+    Display a summary of the geocoding results.
+    
+    Parameters:
+    result_df (DataFrame): DataFrame containing the geocoding results
+    country (str, optional): Country name used for geocoding
+    name_column (str): Column name containing location names
+    
+    Returns:
+    dict: Dictionary containing summary statistics and potential errors
+    """
+    # Au lieu de filtrer (supprimer) les lignes avec des adresses invalides, on met à None les colonnes calculées
+    updated_df = result_df.copy()
+    # Only the columns this summary actually touches; the checkpoint schema
+    # would leak a meaningless Locality_Filter column into Nominatim results
+    _ensure_columns(updated_df, _RESULT_DTYPES)
+    country_term = (country or "").lower().strip()
+    # Si l'adresse est vide ou égale au nom du pays, on remet à None les colonnes
+    # de géocodage — single vectorized mask and .loc assignment instead of iterrows
+    addr_norm = updated_df['Address'].astype('string').str.strip().str.lower()
+    invalid = addr_norm.isna() | (addr_norm == '') | (addr_norm == country_term)
+    updated_df.loc[invalid, ['Lat', 'Lng', 'Address', 'Maps_Link']] = None
+
+    total_locations = len(updated_df)
+    locations_with_coordinates = updated_df['Lat'].notna().sum()
+    locations_without_coordinates = total_locations - locations_with_coordinates
+    success_rate = (locations_with_coordinates / total_locations) * 100 if total_locations > 0 else 0
+    filtered_count = total_locations - locations_with_coordinates
+
+    potential_errors = find_potential_errors(updated_df, name_column)
+    
+    summary = {
+        "total_locations": total_locations,
+        "locations_with_coordinates": locations_with_coordinates,
+        "locations_without_coordinates": locations_without_coordinates,
+        "success_rate": success_rate,
+        "clean_and_correct_results": filtered_count,  # Key renommée ici
+        "potential_errors": potential_errors,
+        "sample_results": updated_df.head(5).to_dict('records')
+    }
+    
+    return summary, updated_df
@@ -1,188 +1,510 @@
-import pandas as pd
-import requests
-import time
-import os
-import pycountry
-from urllib.parse import quote
-
-def get_coordinates_with_nominatim(input_df, output_file, country=None, name_column='remote_name', city_column='remote_city_name', progress_callback=None, lock_to_settlement=False):
-    """
-    Get GPS coordinates for each location from the DataFrame using Nominatim (OpenStreetMap).
-
-    Parameters:
-    input_df (DataFrame): DataFrame containing locations
-    output_file (str): Path to save the results
-    country (str, optional): Country name to use for geocoding, can be None for global search
-    name_column (str): Column name containing location names
-    city_column (str): Column name containing city names
-    progress_callback (function, optional): Callback function to update progress
-    lock_to_settlement (bool, optional): If True, restricts search to featureType=settlement
-
-    Returns:
-    DataFrame: Original DataFrame with added coordinates
-    """
-    # Nominatim API endpoint
-    nominatim_endpoint = "https://nominatim.openstreetmap.org/search"
-    
-    # Set user-agent for API request (required by Nominatim)
-    headers = {
-        'User-Agent': 'StationGeocodingTool/1.0',
-    }
-
-    # Create a copy of the input DataFrame
-    result_df = input_df.copy()
-    
-    # Add new columns for coordinates and address
-    if 'Lat' not in result_df.columns:
-        result_df['Lat'] = None
-    if 'Lng' not in result_df.columns:
-        result_df['Lng'] = None
-    if 'Address' not in result_df.columns:
-        result_df['Address'] = None
-    if 'OSM_ID' not in result_df.columns:
-        result_df['OSM_ID'] = None
-    if 'OSM_Type' not in result_df.columns:
-        result_df['OSM_Type'] = None
-    # Add Maps_Link column
-    if 'Maps_Link' not in result_df.columns:
-        result_df['Maps_Link'] = None
-    
-    # Check if results file already exists to resume processing
-    processed_indices = set()
-    if os.path.exists(output_file):
-        try:
-            existing_results = pd.read_csv(output_file)
-            # Check if the existing results have the required columns
-            required_columns = ['Lat', 'Lng', 'Address', name_column]
-            if all(col in existing_results.columns for col in required_columns):
-                # Map the existing results to our result DataFrame
-                for idx, row in existing_results.iterrows():
-                    if pd.notna(row['Lat']) and pd.notna(row['Lng']):
-                        # Find matching rows in our result_df
-                        matching_rows = result_df[result_df[name_column] == row[name_column]]
-                        if not matching_rows.empty:
-                            for match_idx in matching_rows.index:
-                                result_df.at[match_idx, 'Lat'] = row['Lat']
-                                result_df.at[match_idx, 'Lng'] = row['Lng']
-                                result_df.at[match_idx, 'Address'] = row['Address']
-                                if 'OSM_ID' in existing_results.columns:
-                                    result_df.at[match_idx, 'OSM_ID'] = row['OSM_ID']
-                                if 'OSM_Type' in existing_results.columns:
-                                    result_df.at[match_idx, 'OSM_Type'] = row['OSM_Type']
-                                processed_indices.add(match_idx)
-                
-                print(f"Resuming process: {len(processed_indices)} locations already processed.")
-        except Exception as e:
-            print(f"Error reading existing file: {e}")
-
-    # Filter to process only locations not yet processed
-    rows_to_process = [idx for idx in result_df.index if idx not in processed_indices]
-    
-    print(f"Number of locations to process: {len(rows_to_process)}")
-
-    # Process each location
-    for i, idx in enumerate(rows_to_process):
-        row = result_df.loc[idx]
-        
-        # Get location name and city
-        location_name = row[name_column] if pd.notna(row[name_column]) else ""
-        city_name = row[city_column] if city_column in result_df.columns and pd.notna(row[city_column]) else ""
-        
-        # Create query string by combining location name and city
-        if city_name:
-            query = f"{location_name}, {city_name}"
-        else:
-            query = location_name
-            
-        # Add country if specified
-        if country:
-            query += f", {country}"
-            
-        try:
-            print(f"[{i+1}/{len(rows_to_process)}] Processing: {query}")
-            
-            # Prepare API parameters
-            params = {
-                'q': query,
-                'format': 'json',
-                'limit': 1,  # Get only the best match
-                'addressdetails': 1  # Include address details
-            }
-            # Ajoute les paramètres pour restreindre à settlement si demandé
-            if lock_to_settlement:
-                params['extratags'] = 1
-                params['featureType'] = 'settlement'
-            
-            # Add country code if provided (Nominatim prefers country codes)
-            if country:
-                try:
-                    # Try to get country code from name
-                    countries = list(pycountry.countries.search_fuzzy(country))
-                    if countries:
-                        params['countrycodes'] = countries[0].alpha_2.lower()
-                except:
-                    # If country code can't be determined, use country name as is
-                    pass
-            
-            # Make the API request
-            response = requests.get(nominatim_endpoint, params=params, headers=headers)
-            
-            if response.status_code == 200:
-                results = response.json()
-                
-                if results:
-                    # Get the best match (first result)
-                    best_match = results[0]
-                    
-                    # Extract coordinates and address
-                    lat = float(best_match['lat'])
-                    lng = float(best_match['lon'])
-                    display_name = best_match['display_name']
-                    
-                    # Get OSM details
-                    osm_id = best_match.get('osm_id')
-                    osm_type = best_match.get('osm_type')
-                    
-                    # Update the result DataFrame
-                    result_df.at[idx, 'Lat'] = lat
-                    result_df.at[idx, 'Lng'] = lng
-                    result_df.at[idx, 'Address'] = display_name
-                    result_df.at[idx, 'OSM_ID'] = osm_id
-                    result_df.at[idx, 'OSM_Type'] = osm_type
-                    # Add Google Maps link
-                    result_df.at[idx, 'Maps_Link'] = f"https://www.google.com/maps?q={lat},{lng}"
-                else:
-                    print(f"No results found for: {query}")
-            else:
-                print(f"API error ({response.status_code}) for: {query}")
-                
-            # Save progress periodically
-            if (i + 1) % 10 == 0 or i == len(rows_to_process) - 1:
-                result_df.to_csv(output_file, index=False)
-                print(f"Intermediate save: {i+1} locations processed")
-
-            # Pause to respect Nominatim's usage policy (max 1 request per second)
-            time.sleep(1.1)  # Slightly more than 1 second to be safe
-
-            # Update progress bar if callback is provided
-            if progress_callback:
-                progress_callback(i + 1, len(rows_to_process))
-
-        except Exception as e:
-            print(f"Error processing {query}: {e}")
-            
-            # Save in case of error
-            result_df.to_csv(output_file, index=False)
-
-            # Wait a bit longer in case of error
-            time.sleep(2)
-
-            # Update progress bar on error as well
-            if progress_callback:
-                progress_callback(i + 1, len(rows_to_process))
-
-    # Save final result
-    result_df.to_csv(output_file, index=False)
-    print(f"Processing completed! Results saved to {output_file}")
-
-    return result_df
+import asyncio
+import csv
+import glob
+import numpy as np
+import pandas as pd
+import random
+import aiohttp
+import requests
+import shelve
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import time
+import os
+import pycountry
+from urllib.parse import quote
+
+# orjson parses responses in C, several times faster than stdlib json
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+# Nominatim API endpoint
+NOMINATIM_ENDPOINT = "https://nominatim.openstreetmap.org/search"
+
+# Fan-out settings used against self-hosted Nominatim mirrors only; the
+# public endpoint is always served by the serial 1 req/s path
+NOMINATIM_MAX_CONCURRENCY = 10
+NOMINATIM_MAX_RPS = 10
+
+def _build_params(location_name, city_name, country, country_code, lock_to_settlement):
+    """
+    Build Nominatim query params, preferring the structured search fields over
+    free-text q= whenever more than the bare name is known — structured
+    queries skip the server's free-text parsing and cache better. Station
+    names map to the amenity field (they are points of interest, not streets).
+    """
+    params = {'format': 'json', 'limit': 1, 'addressdetails': 1}
+    if city_name or country:
+        if location_name:
+            params['amenity'] = location_name
+        if city_name:
+            params['city'] = city_name
+        if country:
+            params['country'] = country
+    else:
+        params['q'] = location_name
+    # Restreint à settlement si demandé
+    if lock_to_settlement:
+        params['extratags'] = 1
+        params['featureType'] = 'settlement'
+    # Nominatim prefers country codes when one could be resolved
+    if country_code:
+        params['countrycodes'] = country_code
+    return params
+
+async def _geocode_batch_async(jobs, endpoint, headers, max_concurrency, requests_per_second):
+    """
+    Fetch many Nominatim queries concurrently against a self-hosted endpoint.
+
+    jobs is a list of (key, params) tuples; returns a dict mapping each key to
+    the best match (first result) or None. Only keys that received a 200 are
+    present — failed requests are absent so the caller can retry them on the
+    next resume. Concurrency is bounded by a semaphore and total throughput by
+    a token bucket, mirroring the async Google path in geocoding_functions.
+    """
+    results = {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    rate_lock = asyncio.Lock()
+    next_request_at = 0.0
+
+    async def wait_for_slot():
+        nonlocal next_request_at
+        async with rate_lock:
+            now = asyncio.get_running_loop().time()
+            delay = next_request_at - now
+            next_request_at = max(now, next_request_at) + 1.0 / requests_per_second
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def fetch_one(http, key, params):
+        async with semaphore:
+            await wait_for_slot()
+            try:
+                async with http.get(endpoint, params=params, headers=headers) as response:
+                    if response.status == 200:
+                        payload = await response.json(loads=_json_loads)
+                        return key, payload[0] if payload else None, True
+                    print(f"API error ({response.status}) for: {key}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error processing {key}: {e}")
+            return key, None, False
+
+    timeout = aiohttp.ClientTimeout(total=10)
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        tasks = [fetch_one(http, key, params) for key, params in jobs]
+        for future in asyncio.as_completed(tasks):
+            key, best_match, completed = await future
+            if completed:
+                results[key] = best_match
+    return results
+
+def get_coordinates_with_nominatim(input_df, output_file, country=None, name_column='remote_name', city_column='remote_city_name', progress_callback=None, lock_to_settlement=False, session=None, endpoint=NOMINATIM_ENDPOINT, max_concurrency=NOMINATIM_MAX_CONCURRENCY, requests_per_second=NOMINATIM_MAX_RPS):
+    """
+    Get GPS coordinates for each location from the DataFrame using Nominatim (OpenStreetMap).
+
+    Parameters:
+    input_df (DataFrame): DataFrame containing locations
+    output_file (str): Path to save the results
+    country (str, optional): Country name to use for geocoding, can be None for global search
+    name_column (str): Column name containing location names
+    city_column (str): Column name containing city names
+    progress_callback (function, optional): Callback function to update progress
+    lock_to_settlement (bool, optional): If True, restricts search to featureType=settlement
+    session (requests.Session, optional): Shared HTTP session so connections are reused across requests
+    endpoint (str): Nominatim endpoint; point this at a self-hosted mirror to fan queries
+        out concurrently (the default public endpoint always stays serial at 1 req/s)
+    max_concurrency (int): Maximum in-flight requests against a self-hosted endpoint
+    requests_per_second (float): Throughput cap against a self-hosted endpoint
+
+    Returns:
+    DataFrame: Original DataFrame with added coordinates
+    """
+    nominatim_endpoint = endpoint
+
+    # Set user-agent for API request (required by Nominatim)
+    headers = {
+        'User-Agent': 'StationGeocodingTool/1.0',
+    }
+
+    # Reuse the shared session if provided so TCP/TLS connections persist
+    # across rows; otherwise build one locally — a single kept-alive
+    # connection avoids a TCP+TLS handshake per request at 1 req/s
+    owns_session = session is None
+    if owns_session:
+        session = requests.Session()
+        retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retries))
+    http = session
+
+    # Create a copy of the input DataFrame
+    result_df = input_df.copy()
+    
+    # Add new columns for coordinates and address, typed from the start so
+    # Lat/Lng live in contiguous float64 buffers rather than object columns
+    # of boxed Python floats
+    if 'Lat' not in result_df.columns:
+        result_df['Lat'] = pd.Series(np.nan, index=result_df.index, dtype='float64')
+    if 'Lng' not in result_df.columns:
+        result_df['Lng'] = pd.Series(np.nan, index=result_df.index, dtype='float64')
+    if 'Address' not in result_df.columns:
+        result_df['Address'] = pd.Series(pd.NA, index=result_df.index, dtype='string')
+    if 'OSM_ID' not in result_df.columns:
+        result_df['OSM_ID'] = pd.Series(pd.NA, index=result_df.index, dtype='Int64')
+    if 'OSM_Type' not in result_df.columns:
+        result_df['OSM_Type'] = pd.Series(pd.NA, index=result_df.index, dtype='string')
+    # Add Maps_Link column
+    if 'Maps_Link' not in result_df.columns:
+        result_df['Maps_Link'] = pd.Series(pd.NA, index=result_df.index, dtype='string')
+    
+    # Check if results file already exists to resume processing
+    processed_indices = set()
+    if os.path.exists(output_file):
+        try:
+            existing_results = pd.read_csv(output_file)
+            # Check if the existing results have the required columns
+            required_columns = ['Lat', 'Lng', 'Address', name_column]
+            if all(col in existing_results.columns for col in required_columns):
+                # Map the existing results onto result_df with one hash join
+                # instead of a boolean scan per existing row
+                existing_valid = (
+                    existing_results.dropna(subset=['Lat', 'Lng'])
+                    .drop_duplicates(subset=[name_column], keep='last')
+                    .set_index(name_column)
+                )
+                resume_columns = ['Lat', 'Lng', 'Address'] + [
+                    col for col in ('OSM_ID', 'OSM_Type') if col in existing_valid.columns
+                ]
+                names = result_df[name_column]
+                for col in resume_columns:
+                    filler = names.map(existing_valid[col])
+                    if col == 'OSM_ID':
+                        # read_csv yields float64 for IDs with gaps
+                        filler = filler.astype('Int64')
+                    result_df[col] = result_df[col].fillna(filler)
+                processed_indices = set(result_df.index[result_df['Lat'].notna() & result_df['Lng'].notna()])
+
+                print(f"Resuming process: {len(processed_indices)} locations already processed.")
+        except Exception as e:
+            print(f"Error reading existing file: {e}")
+
+    # A sidecar file lists every name already attempted, including queries
+    # that legitimately returned nothing — without it those rows are
+    # re-queried on every resume because they have no coordinates to map
+    done_file = f"{output_file}.done"
+    if os.path.exists(done_file):
+        try:
+            with open(done_file, encoding='utf-8') as fh:
+                done_names = set(fh.read().splitlines())
+            processed_indices |= {
+                idx for idx, name in zip(result_df.index, result_df[name_column])
+                if str(name) in done_names
+            }
+        except OSError as e:
+            print(f"Error reading progress file: {e}")
+
+    # Filter to process only locations not yet processed
+    rows_to_process = [idx for idx in result_df.index if idx not in processed_indices]
+    
+    print(f"Number of locations to process: {len(rows_to_process)}")
+
+    # Persistent per-query cache: identical (name, city, country) queries are
+    # common for stations, and a hit skips both the API call and the 1.1s
+    # rate-limit sleep — O(N) calls become O(unique queries)
+    query_cache = shelve.open(f"{output_file}.cache")
+
+    # Read the two input columns once and buffer results in plain lists;
+    # per-row .at reads and writes go through pandas' indexing machinery on
+    # every iteration, a bulk column assignment does it once
+    names = result_df[name_column].to_numpy()
+    cities = result_df[city_column].to_numpy() if city_column in result_df.columns else np.full(len(result_df), None, dtype=object)
+    lat_arr = result_df['Lat'].tolist()
+    lng_arr = result_df['Lng'].tolist()
+    addr_arr = result_df['Address'].tolist()
+    oid_arr = result_df['OSM_ID'].tolist()
+    otype_arr = result_df['OSM_Type'].tolist()
+    link_arr = result_df['Maps_Link'].tolist()
+    positions = {idx: pos for pos, idx in enumerate(result_df.index)}
+
+    def flush_results():
+        # One column-wise assignment per flush instead of five .at calls per
+        # row, keeping the typed dtypes the columns were created with
+        result_df['Lat'] = pd.array(lat_arr, dtype='float64')
+        result_df['Lng'] = pd.array(lng_arr, dtype='float64')
+        result_df['Address'] = pd.array(addr_arr, dtype='string')
+        result_df['OSM_ID'] = pd.array(oid_arr, dtype='Int64')
+        result_df['OSM_Type'] = pd.array(otype_arr, dtype='string')
+        result_df['Maps_Link'] = pd.array(link_arr, dtype='string')
+
+    # Append each finished row to the output as it completes instead of
+    # rewriting the whole frame every 10 rows (O(N^2) bytes over a run); the
+    # complete CSV is still rewritten once at the end
+    fieldnames = list(result_df.columns)
+    write_header = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+    csv_fh = open(output_file, 'a', newline='', encoding='utf-8')
+    csv_writer = csv.DictWriter(csv_fh, fieldnames=fieldnames)
+    if write_header:
+        csv_writer.writeheader()
+    row_records = result_df.to_dict('records')
+    done_fh = open(done_file, 'a', encoding='utf-8')
+
+    def mark_done(pos):
+        done_fh.write(f"{names[pos]}\n")
+        done_fh.flush()
+
+    # Resolve the country code once; search_fuzzy walks every ISO entry and
+    # the answer never changes within a run
+    country_code = None
+    if country:
+        try:
+            countries = list(pycountry.countries.search_fuzzy(country))
+            if countries:
+                country_code = countries[0].alpha_2.lower()
+        except:
+            # If country code can't be determined, use country name as is
+            pass
+
+    def append_row(pos):
+        record = row_records[pos]
+        record['Lat'] = lat_arr[pos]
+        record['Lng'] = lng_arr[pos]
+        record['Address'] = addr_arr[pos]
+        record['OSM_ID'] = oid_arr[pos]
+        record['OSM_Type'] = otype_arr[pos]
+        record['Maps_Link'] = link_arr[pos]
+        csv_writer.writerow(record)
+        csv_fh.flush()
+
+    # Group the work by (city, name) — country is constant within a run — so
+    # consecutive queries hit the same server-side indexes and OSM tiles, and
+    # repeated queries land next to each other for the cache. Results are
+    # written back by row position, so the order of processing doesn't matter
+    rows_to_process.sort(
+        key=lambda idx: (
+            str(cities[positions[idx]]) if pd.notna(cities[positions[idx]]) else '',
+            str(names[positions[idx]]) if pd.notna(names[positions[idx]]) else '',
+        )
+    )
+
+    # Deadline for the next public-endpoint request; sleeping only the
+    # remainder lets query building and bookkeeping overlap the 1.1s gap.
+    # When the server signals throttling the gap widens exponentially.
+    next_allowed = time.monotonic()
+    backoff_level = 0
+
+    try:
+        # Self-hosted mirrors are not bound by the public usage policy, so fan
+        # the unique queries out with aiohttp instead of sleeping between rows
+        if nominatim_endpoint != NOMINATIM_ENDPOINT and rows_to_process:
+            jobs = []
+            group_members = {}
+            for idx in rows_to_process:
+                pos = positions[idx]
+                location_name = names[pos] if pd.notna(names[pos]) else ""
+                city_name = cities[pos] if pd.notna(cities[pos]) else ""
+                if not location_name and not city_name:
+                    continue
+                query = f"{location_name}, {city_name}" if city_name else location_name
+                if country:
+                    query += f", {country}"
+                cache_key = query.strip().lower()
+                if cache_key in group_members:
+                    group_members[cache_key].append(pos)
+                    continue
+                group_members[cache_key] = [pos]
+                if cache_key in query_cache:
+                    continue
+                jobs.append((cache_key, _build_params(location_name, city_name, country, country_code, lock_to_settlement)))
+
+            fetched = asyncio.run(_geocode_batch_async(
+                jobs, nominatim_endpoint, headers, max_concurrency, requests_per_second
+            )) if jobs else {}
+
+            for cache_key, members in group_members.items():
+                if cache_key in query_cache:
+                    lat, lng, display_name, osm_id, osm_type = query_cache[cache_key]
+                elif cache_key in fetched:
+                    best_match = fetched[cache_key]
+                    if best_match is None:
+                        # A 200 with no results: complete, nothing to write
+                        for pos in members:
+                            mark_done(pos)
+                        continue
+                    lat = float(best_match['lat'])
+                    lng = float(best_match['lon'])
+                    display_name = best_match['display_name']
+                    osm_id = best_match.get('osm_id')
+                    osm_type = best_match.get('osm_type')
+                    query_cache[cache_key] = (lat, lng, display_name, osm_id, osm_type)
+                else:
+                    # Request failed (5xx/timeout): retry it on the next resume
+                    continue
+                for pos in members:
+                    lat_arr[pos] = lat
+                    lng_arr[pos] = lng
+                    addr_arr[pos] = display_name
+                    oid_arr[pos] = osm_id
+                    otype_arr[pos] = osm_type
+                    link_arr[pos] = f"https://www.google.com/maps?q={lat},{lng}"
+                    mark_done(pos)
+
+            if progress_callback:
+                progress_callback(len(rows_to_process), len(rows_to_process))
+            # The serial loop below has nothing left to do
+            rows_to_process = []
+
+        # Process each location
+        for i, idx in enumerate(rows_to_process):
+            pos = positions[idx]
+
+            # Get location name and city
+            location_name = names[pos] if pd.notna(names[pos]) else ""
+            city_name = cities[pos] if pd.notna(cities[pos]) else ""
+
+            # A blank row would still cost a request and a rate-limit slot
+            if not location_name and not city_name:
+                if progress_callback:
+                    progress_callback(i + 1, len(rows_to_process))
+                continue
+
+            # Create query string by combining location name and city
+            if city_name:
+                query = f"{location_name}, {city_name}"
+            else:
+                query = location_name
+            
+            # Add country if specified
+            if country:
+                query += f", {country}"
+
+            # Serve repeats from the cache without touching the network
+            cache_key = query.strip().lower()
+            if cache_key in query_cache:
+                lat, lng, display_name, osm_id, osm_type = query_cache[cache_key]
+                lat_arr[pos] = lat
+                lng_arr[pos] = lng
+                addr_arr[pos] = display_name
+                oid_arr[pos] = osm_id
+                otype_arr[pos] = osm_type
+                link_arr[pos] = f"https://www.google.com/maps?q={lat},{lng}"
+                append_row(pos)
+                mark_done(pos)
+                if progress_callback:
+                    progress_callback(i + 1, len(rows_to_process))
+                continue
+
+            try:
+                print(f"[{i+1}/{len(rows_to_process)}] Processing: {query}")
+            
+                # Prepare API parameters (structured when city/country are known)
+                params = _build_params(location_name, city_name, country, country_code, lock_to_settlement)
+
+                # Wait out whatever is left of the current rate-limit slot
+                # (max 1 request per second, 1.1s to be safe), then book the next one
+                delay = next_allowed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_allowed = time.monotonic() + 1.1
+
+                # Make the API request
+                response = http.get(nominatim_endpoint, params=params, headers=headers, timeout=10)
+
+                # Adapt pacing to what the server reports: honor Retry-After
+                # when present, double the gap (with jitter, capped at 60s)
+                # while it throttles, and reset once it stops
+                retry_after = response.headers.get('Retry-After')
+                if retry_after is not None:
+                    try:
+                        next_allowed = time.monotonic() + max(1.1, float(retry_after))
+                    except ValueError:
+                        pass
+                if response.status_code in (429, 503):
+                    backoff_level = min(backoff_level + 1, 6)
+                    next_allowed = max(
+                        next_allowed,
+                        time.monotonic() + min(60.0, 2.0 ** backoff_level + random.random()),
+                    )
+                else:
+                    backoff_level = 0
+
+                if response.status_code == 200:
+                    # Parse the raw bytes directly, skipping requests' charset detection
+                    results = _json_loads(response.content) if response.content else []
+                
+                    if results:
+                        # Get the best match (first result)
+                        best_match = results[0]
+                    
+                        # Extract coordinates and address
+                        lat = float(best_match['lat'])
+                        lng = float(best_match['lon'])
+                        display_name = best_match['display_name']
+                    
+                        # Get OSM details
+                        osm_id = best_match.get('osm_id')
+                        osm_type = best_match.get('osm_type')
+                    
+                        # Buffer the result for the next bulk flush
+                        lat_arr[pos] = lat
+                        lng_arr[pos] = lng
+                        addr_arr[pos] = display_name
+                        oid_arr[pos] = osm_id
+                        otype_arr[pos] = osm_type
+                        # Add Google Maps link
+                        link_arr[pos] = f"https://www.google.com/maps?q={lat},{lng}"
+                        # Remember the answer for identical queries later on
+                        query_cache[cache_key] = (lat, lng, display_name, osm_id, osm_type)
+                        # Persist this row immediately; progress is never lost
+                        append_row(pos)
+                        mark_done(pos)
+                    else:
+                        print(f"No results found for: {query}")
+                        # Still completed: don't re-query it on the next resume
+                        mark_done(pos)
+                else:
+                    print(f"API error ({response.status_code}) for: {query}")
+
+                # Update progress bar if callback is provided
+                if progress_callback:
+                    progress_callback(i + 1, len(rows_to_process))
+
+            except Exception as e:
+                print(f"Error processing {query}: {e}")
+
+                # Wait a bit longer in case of error
+                time.sleep(2)
+
+                # Update progress bar on error as well
+                if progress_callback:
+                    progress_callback(i + 1, len(rows_to_process))
+
+    finally:
+        done_fh.close()
+        csv_fh.close()
+        query_cache.close()
+        # Only close sessions created here; callers keep theirs alive
+        if owns_session:
+            session.close()
+
+    # Save final result atomically: a crash mid-write would otherwise corrupt
+    # the very file the resume path reads on the next run
+    flush_results()
+    tmp_file = f"{output_file}.tmp.{os.getpid()}"
+    result_df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+    # The run is complete, so the progress sidecar has served its purpose,
+    # and so has the per-run query cache — it is keyed to this output file
+    # (the app keeps its own cross-run cache), so it would only be orphaned
+    if os.path.exists(done_file):
+        os.remove(done_file)
+    for cache_file in glob.glob(f"{output_file}.cache*"):
+        os.remove(cache_file)
+    print(f"Processing completed! Results saved to {output_file}")
+
+    return result_df